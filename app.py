@@ -2,101 +2,212 @@ import os
 import sys
 import time
 import re
+import bisect
+import csv
+import json
+import urllib.request
 import logging
-import pandas as pd
 import zipfile
 import io
+import secrets
+import tempfile
+import unicodedata
 from pathlib import Path
 from urllib.parse import urljoin, quote, urlparse
-from bs4 import BeautifulSoup
+import lxml.html
+from lxml import etree
 from curl_cffi import requests as cffi_requests
 import warnings
 import threading
 import queue
+from collections import OrderedDict
+from functools import lru_cache
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from flask import Flask, render_template_string, request, jsonify, Response, send_file
+from flask import Flask, request, jsonify, Response
 
 warnings.filterwarnings("ignore")
 
 CSV_URL = "https://raw.githubusercontent.com/vmik559-hue/financial-archiver/refs/heads/main/all-listed-companies.csv"
 DOCUMENTS_ROOT = Path('/tmp') / "Financial_Archive"
 SCREENER_DOMAIN = "https://www.screener.in"
+COMPANIES_TTL = 3600  # seconds before the companies CSV is fetched again
+COMPANIES_SNAPSHOT = Path('/tmp') / "companies.json"  # parsed company rows shared by worker restarts
+COMPANIES_SNAPSHOT_MAX_AGE = 86400  # oldest snapshot still served when the CSV can't be fetched
 DOCUMENTS_ROOT.mkdir(parents=True, exist_ok=True)
 
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 
-log_queue = queue.Queue()
-MAX_WORKERS = 1  # Sequential download for Vercel compatibility
+MAX_WORKERS = 16  # parallel PDF downloads, shared by all extractions in this process
+DOWNLOAD_BUFFER_SIZE = 1024 * 1024  # write buffer per PDF being saved
+STALE_PART_AGE = 120  # .part files older than this (gunicorn --timeout) were left by a killed worker
+ZIP_CHUNK_SIZE = 1024 * 1024  # bytes read from disk per step while streaming a ZIP
+LOG_QUEUE_SIZE = 256  # pending events per extraction (in practice a handful, see report_progress)
+
+# Screener serves UTF-8; declaring it skips libxml2's encoding detection
+HTML_PARSER = lxml.html.HTMLParser(encoding='utf-8')
+
+SANITIZE_RE = re.compile(r'[\\/*?:"<>|]')
+YEAR_RE = re.compile(r'\b(20\d{2})\b')
+MONTH_RE = re.compile(r'\b(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)\b', re.I)
+MONTH_NAMES = {m: m.capitalize() for m in ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec')}
+
+# Queued in place of a PROGRESS line; the stream then reads the latest one from the fetcher
+PROGRESS_PENDING = object()
+
+# One scan tags a link's text with its category; group names are the category names
+LINK_CATEGORY_RE = re.compile(r'(?P<Transcript>transcript)|(?P<PPT>^ppt$)')
+
+def xpath_lower(expr):
+    """XPath 1.0 has no lower-case(), so fold ASCII letters with translate()"""
+    return f"translate({expr}, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')"
+
+def node_text(element, sep=" "):
+    """Text of an lxml element with each piece stripped, like bs4's get_text(sep, strip=True)"""
+    return sep.join(s.strip() for s in element.itertext() if s.strip())
+
+# Page queries, compiled once at import
+AR_SECTION_XPATH = etree.XPath("//div[@id='annual-reports']")
+AR_HEADER_XPATH = etree.XPath(f"//*[self::h2 or self::h3][contains({xpath_lower('.')}, 'annual report')]")
+NEXT_DIV_XPATH = etree.XPath("(descendant::div | following::div)[1]")
+# The first link of every <li> in the annual-reports section
+AR_LINKS_XPATH = etree.XPath("descendant::li/descendant::a[@href][1]")
+
+@lru_cache(maxsize=None)
+def host_headers(netloc):
+    """Per-host headers layered over the session's; a company's files come from a few
+    hosts, so each mapping is built once. Callers must not modify the returned dict."""
+    # Enhanced headers for BSE India URLs
+    if 'bseindia' in netloc:
+        return {
+            'Referer': 'https://www.bseindia.com/',
+            'Accept': 'application/pdf,*/*',
+            'Accept-Language': 'en-US,en;q=0.9',
+            'Connection': 'keep-alive',
+        }
+    if 'nseindia' in netloc:
+        return {'Referer': 'https://www.nseindia.com/'}
+    return {'Referer': SCREENER_DOMAIN}
+
+REQUEST_HEADERS = {
+    'authority': 'www.screener.in',
+    'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+}
+
+# One keep-alive session for the whole process. curl_cffi gives each thread its own curl
+# handle, so the long-lived DOWNLOAD_EXECUTOR threads keep their connections (and TLS
+# sessions) to screener/BSE/NSE across files and across extractions, and nothing is left
+# behind per extraction. The base headers live on the session; requests pass what differs.
+HTTP_SESSION = cffi_requests.Session(impersonate="chrome120", headers=REQUEST_HEADERS)
 
 class ScreenerUnifiedFetcher:
     def __init__(self):
-        self.headers = {
-            'authority': 'www.screener.in',
-            'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        }
         self.downloaded_files = []
         self.company_root = None
+        self.archive_files = []
+        # Bounded so an abandoned stream (client gone) can't pile up events. PROGRESS is
+        # coalesced into one pending slot, so besides it the queue only ever holds the few
+        # control events (STATUS, TOTAL, COMPLETE/ERROR, sentinel) and their puts never block.
+        self.log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self.progress_lock = threading.Lock()
+        self.pending_progress = None
+        self.row_texts = {}
+        self.session = HTTP_SESSION
+
+    def report_progress(self, message):
+        """Queue a PROGRESS update; one not yet read by the stream is replaced, not added to"""
+        with self.progress_lock:
+            queued = self.pending_progress is not None
+            self.pending_progress = message
+        if not queued:
+            self.log_queue.put(PROGRESS_PENDING)
+
+    def take_progress(self):
+        """Latest PROGRESS update, for the stream once it reads PROGRESS_PENDING"""
+        with self.progress_lock:
+            message, self.pending_progress = self.pending_progress, None
+        return message
 
     def sanitize(self, name):
-        return re.sub(r'[\\/*?:"<>|]', "", str(name)).strip()
+        return SANITIZE_RE.sub("", str(name)).strip()
 
     def extract_metadata(self, element):
         """Extract year and month from element - checks multiple places"""
         # Try to get text from parent li first, then link itself
-        row = element.find_parent('li')
-        search_text = row.get_text(" ", strip=True) if row else element.get_text(" ", strip=True)
+        row = next(element.iterancestors('li'), None)
+        if row is None:
+            search_text = node_text(element)
+        else:
+            # A concall row holds several links (Transcript, PPT, ...) - walk its text once
+            search_text = self.row_texts.get(row)
+            if search_text is None:
+                search_text = self.row_texts[row] = node_text(row)
         
         # Also check the href attribute for year
         href = element.get('href', '')
         combined_text = search_text + " " + href
         
         # Look for 4-digit year (2000-2099)
-        year_matches = re.findall(r'\b(20\d{2})\b', combined_text)
-        year = year_matches[0] if year_matches else "Unknown_Year"
+        year_match = YEAR_RE.search(combined_text)
+        year = year_match.group(1) if year_match else "Unknown_Year"
         
-        # Look for month names
-        month_list = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
-        month_name = "General"
-        
-        for m in month_list:
-            if re.search(rf'\b{m}\b', combined_text, re.I):
-                month_name = m.capitalize()
-                break
+        # Look for month names - one alternation instead of a search per month
+        month_match = MONTH_RE.search(combined_text)
+        month_name = MONTH_NAMES[month_match.group(1).lower()] if month_match else "General"
         
         return year, month_name
 
+    def save_url(self, full_url, save_path, headers, impersonate=None):
+        """GET full_url into save_path; returns (status, saved), saved only for a 200 with a real body (>1000 bytes)"""
+        # content_callback, not stream=True, so the thread's keep-alive connection is reused;
+        # the body goes to a unique .part file that is renamed into place once complete
+        fd, part_name = tempfile.mkstemp(dir=save_path.parent, prefix=f"{save_path.name}.", suffix='.part')
+        part_path = Path(part_name)
+        size = 0
+        try:
+            with open(fd, 'wb', buffering=DOWNLOAD_BUFFER_SIZE) as f:
+                def write_chunk(chunk):
+                    nonlocal size
+                    f.write(chunk)
+                    size += len(chunk)
+                    return len(chunk)
+
+                r = self.session.get(full_url, headers=headers, impersonate=impersonate, timeout=45,
+                                     allow_redirects=True, content_callback=write_chunk)
+        except BaseException:
+            part_path.unlink(missing_ok=True)
+            raise
+        if r.status_code != 200 or size <= 1000:
+            part_path.unlink(missing_ok=True)
+            return r.status_code, False
+        os.replace(part_path, save_path)
+        self.downloaded_files.append(str(save_path))
+        return r.status_code, True
+
     def download_file(self, url, save_path, max_retries=3):
         """Download file with retry logic and fallback for Vercel compatibility"""
+        # File names are fixed per year (and, for concalls, page order), so a warm instance may
+        # already hold this file from an earlier run; a size check is enough to skip the network
+        try:
+            if save_path.stat().st_size > 1000:
+                self.downloaded_files.append(str(save_path))
+                return True
+        except FileNotFoundError:
+            pass
+
         full_url = urljoin(SCREENER_DOMAIN, url)
         is_bseplus = 'bseplus' in full_url
-        
+        headers = host_headers(urlparse(full_url).netloc)
+
         for attempt in range(max_retries):
             try:
-                headers = self.headers.copy()
-                domain = urlparse(full_url).netloc
-                
-                # Enhanced headers for BSE India URLs
-                if 'bseindia' in domain:
-                    headers.update({
-                        'Referer': 'https://www.bseindia.com/',
-                        'Accept': 'application/pdf,*/*',
-                        'Accept-Language': 'en-US,en;q=0.9',
-                        'Connection': 'keep-alive',
-                    })
-                elif 'nseindia' in domain:
-                    headers['Referer'] = 'https://www.nseindia.com/'
-                else:
-                    headers['Referer'] = SCREENER_DOMAIN
-
                 # Try curl_cffi first with shorter timeout
-                r = cffi_requests.get(full_url, headers=headers, impersonate="chrome120", timeout=45, allow_redirects=True)
-                
-                if r.status_code == 200 and len(r.content) > 1000:
-                    save_path.parent.mkdir(parents=True, exist_ok=True)
-                    with open(save_path, 'wb') as f:
-                        f.write(r.content)
-                    self.downloaded_files.append(str(save_path))
+                status, saved = self.save_url(full_url, save_path, headers)
+                if saved:
                     return True
+                
+                # Dead links answer 200 with a tiny error page; retrying won't change that
+                if status == 200:
+                    return False
                     
                 # Retry on non-200 status
                 if attempt < max_retries - 1:
@@ -112,12 +223,7 @@ class ScreenerUnifiedFetcher:
                     try:
                         alt_browsers = ["chrome110", "chrome116", "safari15_5"]
                         alt_browser = alt_browsers[attempt % len(alt_browsers)]
-                        r = cffi_requests.get(full_url, headers=headers, impersonate=alt_browser, timeout=45, allow_redirects=True)
-                        if r.status_code == 200 and len(r.content) > 1000:
-                            save_path.parent.mkdir(parents=True, exist_ok=True)
-                            with open(save_path, 'wb') as f:
-                                f.write(r.content)
-                            self.downloaded_files.append(str(save_path))
+                        if self.save_url(full_url, save_path, headers, impersonate=alt_browser)[1]:
                             return True
                     except:
                         pass
@@ -126,131 +232,248 @@ class ScreenerUnifiedFetcher:
         
         return False
 
+    def iter_download_tasks(self, tree, comp_root, symbol_upper, selected_types, start_year, end_year):
+        """Yield (category, label, href, file_path) for each document on the page, as the page's links are walked"""
+        want_ar = 'all' in selected_types or 'annual_reports' in selected_types
+        wanted_cats = {
+            cat for cat, key in (("Transcript", "transcript"), ("PPT", "ppt"))
+            if 'all' in selected_types or key in selected_types
+        }
+
+        # Annual report links are picked out of their section up front, so the single
+        # walk over the page's anchors below can tell them apart by set membership
+        ar_links = set()
+        if want_ar:
+            ar_section = next(iter(AR_SECTION_XPATH(tree)), None)
+            if ar_section is None:
+                header = next(iter(AR_HEADER_XPATH(tree)), None)
+                if header is not None: ar_section = next(iter(NEXT_DIV_XPATH(header)), None)
+            if ar_section is not None:
+                ar_links = set(AR_LINKS_XPATH(ar_section))
+
+        if not ar_links and not wanted_cats:
+            return
+
+        seen_urls = set()
+        used_names = {}
+        # One Path and one mkdir per category folder, made the first time a task needs it
+        save_dirs = {}
+
+        def save_dir_for(folder):
+            save_dir = save_dirs.get(folder)
+            if save_dir is None:
+                save_dir = save_dirs[folder] = comp_root / folder
+                save_dir.mkdir(parents=True, exist_ok=True)
+                stale = time.time() - STALE_PART_AGE
+                for part in save_dir.glob('*.part'):
+                    try:
+                        if part.stat().st_mtime < stale:
+                            part.unlink()
+                    except OSError:
+                        pass
+            return save_dir
+
+        for link in tree.iter('a'):
+            href = link.get('href')
+            if not href:
+                continue
+
+            # ===== ANNUAL REPORTS - FIXED LOGIC =====
+            if link in ar_links:
+                li = next(link.iterancestors('li'))
+                full_row_text = node_text(li)
+                year_match = YEAR_RE.search(full_row_text)
+                
+                if not year_match:
+                    continue
+                    
+                year = year_match.group(1)
+                year_int = int(year)
+                
+                # Skip if outside year range
+                if year_int < start_year or year_int > end_year:
+                    continue
+                
+                file_path = save_dir_for("Annual_Reports") / f"Annual_Report_{year}.pdf"
+                yield ('Annual Report', year, href, file_path)
+                continue
+
+            # ===== PPT & TRANSCRIPTS - FIXED LOGIC =====
+            if not wanted_cats:
+                continue
+            # Cheap href checks first; only surviving links pay for the text walk
+            if not href.startswith(('http://', 'https://')) or href in seen_urls or "consolidated" in href:
+                continue
+            link_text = node_text(link, sep="").lower()
+
+            m = LINK_CATEGORY_RE.search(link_text)
+            cat = m.lastgroup if m else None
+            
+            if cat in wanted_cats:
+                year, month = self.extract_metadata(link)
+                
+                # FIXED: Skip if year is unknown OR outside range
+                if year == "Unknown_Year":
+                    continue
+                    
+                year_int = int(year)
+                if year_int < start_year or year_int > end_year:
+                    continue
+                
+                seen_urls.add(href)
+                save_dir = save_dir_for(cat)
+                
+                # Only names assigned earlier on this page count as taken, so a link gets the
+                # same name on every run and download_file can skip a copy already on disk
+                used = used_names.setdefault(cat, set())
+                
+                fname = f"{symbol_upper}_{month}_{year}_{cat}.pdf"
+                counter = 1
+                while fname in used:
+                    fname = f"{symbol_upper}_{month}_{year}_{cat}_{counter}.pdf"
+                    counter += 1
+                used.add(fname)
+                file_path = save_dir / fname
+                
+                yield (cat, f"{year}-{month}", href, file_path)
+
     def process_company(self, symbol, name, start_year, end_year, download_type='all'):
         self.downloaded_files = []
+        self.row_texts = {}
         symbol_upper = str(symbol).upper()
-        log_queue.put(f"STATUS|Fetching data for {name}...")
+        self.log_queue.put(f"STATUS|Fetching data for {name}...")
         url = f"{SCREENER_DOMAIN}/company/{quote(symbol)}/"
         
         # Parse download_type to support multiple comma-separated values
         selected_types = [t.strip() for t in download_type.split(',')]
         
         try:
-            resp = cffi_requests.get(url, headers=self.headers, impersonate="chrome120", timeout=30)
-            soup = BeautifulSoup(resp.content, 'html.parser')
+            resp = self.session.get(url, timeout=30)
+            tree = lxml.html.fromstring(resp.content, parser=HTML_PARSER)
         except Exception as e:
-            log_queue.put(f"ERROR|Connection failed: {str(e)}")
+            self.log_queue.put(f"ERROR|Connection failed: {str(e)}")
             return None
 
         comp_root = DOCUMENTS_ROOT / self.sanitize(name)
         self.company_root = str(comp_root)
-        download_tasks = []
         
-        # ===== ANNUAL REPORTS - FIXED LOGIC =====
-        if 'all' in selected_types or 'annual_reports' in selected_types:
-            ar_section = soup.find('div', id='annual-reports')
-            if not ar_section:
-                header = soup.find(lambda tag: tag.name in ['h2', 'h3'] and 'annual report' in tag.text.lower())
-                if header: ar_section = header.find_next('div')
-
-            if ar_section:
-                ar_items = ar_section.find_all('li')
-                for li in ar_items:
-                    link = li.find('a', href=True)
-                    if not link:
-                        continue
-                        
-                    full_row_text = li.get_text(" ", strip=True)
-                    year_match = re.search(r'\b(20\d{2})\b', full_row_text)
-                    
-                    if not year_match:
-                        continue
-                        
-                    year = year_match.group(1)
-                    year_int = int(year)
-                    
-                    # Skip if outside year range
-                    if year_int < start_year or year_int > end_year:
-                        continue
-                    
-                    save_dir = comp_root / "Annual_Reports"
-                    file_path = save_dir / f"Annual_Report_{year}.pdf"
-                    download_tasks.append(('Annual Report', year, link['href'], file_path))
-
-        # ===== PPT & TRANSCRIPTS - FIXED LOGIC =====
-        if 'all' in selected_types or 'ppt' in selected_types or 'transcript' in selected_types:
-            all_links = soup.find_all('a', href=True)
-            seen_urls = set()
-
-            for link in all_links:
-                link_text = link.get_text(strip=True).lower()
-                href = link['href']
-                if href in seen_urls or not href.startswith('http') or "consolidated" in href: 
-                    continue
-
-                cat = None
-                if "transcript" in link_text and ('all' in selected_types or 'transcript' in selected_types): 
-                    cat = "Transcript"
-                elif link_text == "ppt" and ('all' in selected_types or 'ppt' in selected_types): 
-                    cat = "PPT"
-                
-                if cat:
-                    year, month = self.extract_metadata(link)
-                    
-                    # FIXED: Skip if year is unknown OR outside range
-                    if year == "Unknown_Year":
-                        continue
-                        
-                    year_int = int(year)
-                    if year_int < start_year or year_int > end_year:
-                        continue
-                    
-                    seen_urls.add(href)
-                    save_dir = comp_root / cat
-                    
-                    fname = f"{symbol_upper}_{month}_{year}_{cat}.pdf"
-                    file_path = save_dir / fname
-                    
-                    counter = 1
-                    while file_path.exists():
-                        file_path = save_dir / f"{symbol_upper}_{month}_{year}_{cat}_{counter}.pdf"
-                        counter += 1
-                    
-                    download_tasks.append((cat, f"{year}-{month}", href, file_path))
-
-        total_files = len(download_tasks)
+        completed = 0
+        start_time = time.monotonic()
+        last_emit = float("-inf")
+        
+        # Each download is submitted to the shared pool as soon as the parser yields it, so
+        # annual reports are already transferring while the concall links are still being scanned
+        future_to_task = {
+            DOWNLOAD_EXECUTOR.submit(self.download_file, task[2], task[3]): task 
+            for task in self.iter_download_tasks(tree, comp_root, symbol_upper, selected_types, start_year, end_year)
+        }
+        total_files = len(future_to_task)
         
         if total_files == 0:
-            log_queue.put("STATUS|No files found in the specified year range")
-            log_queue.put("COMPLETE|0|0|")
+            self.log_queue.put("STATUS|No files found in the specified year range")
+            self.log_queue.put("COMPLETE|0|0|")
             return None
 
-        log_queue.put(f"TOTAL|{total_files}")
-        
-        completed = 0
-        start_time = time.time()
+        self.log_queue.put(f"TOTAL|{total_files}")
         
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            future_to_task = {
-                executor.submit(self.download_file, task[2], task[3]): task 
-                for task in download_tasks
-            }
+        for future in as_completed(future_to_task):
+            completed += 1
+            now = time.monotonic()
+            # Coalesce to ~10 updates/s; the UI only needs the latest, and the last one always goes out
+            if now - last_emit < 0.1 and completed < total_files:
+                continue
+            last_emit = now
             
-            for future in as_completed(future_to_task):
-                completed += 1
-                elapsed = time.time() - start_time
-                avg_time = elapsed / completed
-                remaining = total_files - completed
-                eta_seconds = int(avg_time * remaining)
-                
-                log_queue.put(f"PROGRESS|{completed}|{total_files}|{eta_seconds}")
-                time.sleep(0.05)
+            elapsed = now - start_time
+            avg_time = elapsed / completed
+            remaining = total_files - completed
+            eta_seconds = int(avg_time * remaining)
+            
+            self.report_progress(f"PROGRESS|{completed}|{total_files}|{eta_seconds}")
+
+        # List the archive once here so /download can stream it without walking the tree again
+        self.archive_files = list(walk_pdfs(comp_root)) if comp_root.is_dir() else []
         
-        log_queue.put(f"COMPLETE|{completed}|{total_files}|{self.company_root}")
+        self.log_queue.put(f"COMPLETE|{completed}|{total_files}|{self.company_root}")
         return self.company_root
 
+# One long-lived pool for every extraction: threads are started once rather than per
+# company, and concurrent users share MAX_WORKERS instead of each adding their own
+DOWNLOAD_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='download')
+
 app = Flask(__name__)
-download_sessions = {}
+
+SESSION_TTL = 300  # seconds a finished extraction stays downloadable
+download_sessions = OrderedDict()  # insertion order == timestamp order
+sessions_lock = threading.Lock()
+
+def prune_download_sessions():
+    """Every minute, drop expired sessions from the front of download_sessions"""
+    while True:
+        time.sleep(60)
+        cutoff = time.time() - SESSION_TTL
+        with sessions_lock:
+            while download_sessions and next(iter(download_sessions.values()))['timestamp'] < cutoff:
+                download_sessions.popitem(last=False)
+
+threading.Thread(target=prune_download_sessions, daemon=True).start()
+
+def attachment_filename(filename):
+    """Content-Disposition filename params as send_file builds them: an ASCII fallback
+    plus RFC 5987 filename* when the name isn't ASCII (headers must be latin-1)"""
+    try:
+        filename.encode('ascii')
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+        return {'filename': simple, 'filename*': f"UTF-8''{quote(filename, safe='!#$&+^`|~')}"}
+    return {'filename': filename}
+
+def walk_pdfs(root):
+    """Recursively yield PDF paths under root using os.scandir's cached DirEntry info"""
+    with os.scandir(root) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk_pdfs(entry.path)
+            elif entry.name.endswith('.pdf'):
+                yield entry.path
+
+class ZipChunkSink(io.RawIOBase):
+    """Write-only, unseekable target for ZipFile; stream_zip drains what was written"""
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+def stream_zip(file_paths, arc_root):
+    """Yield a ZIP of file_paths entry by entry instead of building it in memory"""
+    sink = ZipChunkSink()
+    # ZipFile sees an unseekable file and writes data descriptors after each entry.
+    # PDFs are already Flate-compressed, so entries are stored rather than deflated again.
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as zipf:
+        for file_path in file_paths:
+            try:
+                zinfo = zipfile.ZipInfo.from_file(file_path, os.path.relpath(file_path, arc_root))
+            except FileNotFoundError:
+                continue  # removed from /tmp since the extraction listed it
+            zinfo.compress_type = zipf.compression
+            # Copy the PDF through in fixed-size chunks, handing each one to the response,
+            # so memory per download stays around ZIP_CHUNK_SIZE whatever the file size
+            with open(file_path, 'rb') as src, zipf.open(zinfo, 'w') as dest:
+                for chunk in iter(lambda: src.read(ZIP_CHUNK_SIZE), b''):
+                    dest.write(chunk)
+                    yield from sink.drain()
+            yield from sink.drain()
+    # Central directory, written when the ZipFile closes
+    yield from sink.drain()
 
 HTML_TEMPLATE = '''<!DOCTYPE html>
 <html lang="en">
@@ -667,38 +890,165 @@ function downloadZip(){
 
 @app.route('/')
 def index():
-    return render_template_string(HTML_TEMPLATE)
+    # The page has no template variables, so skip Jinja and send it as is
+    return Response(HTML_TEMPLATE, mimetype='text/html')
+
+SEARCH_LIMIT = 10
+_company_cache = {'data': None, 'ts': 0, 'refreshing': False}
+_company_lock = threading.Lock()
+
+def index_companies(records):
+    """Build the search indexes from (name, nse, bse) records:
+    records, by_nse / by_bse (code -> row numbers),
+    names_lower (per row) and names_sorted ((name_lower, row) pairs)"""
+    by_nse, by_bse, names_lower = {}, {}, []
+    for i, (name, nse, bse) in enumerate(records):
+        names_lower.append(name.lower())
+        if nse:
+            by_nse.setdefault(nse.lower(), []).append(i)
+        if bse:
+            by_bse.setdefault(bse, []).append(i)
+    return {
+        'records': records,
+        'by_nse': by_nse,
+        'by_bse': by_bse,
+        'names_lower': names_lower,
+        'names_sorted': sorted((n, i) for i, n in enumerate(names_lower)),
+    }
+
+def read_companies_snapshot(max_age):
+    """Load the snapshot's (name, nse, bse) records if it is younger than max_age seconds, else None"""
+    # Plain JSON, never pickle: anything that can write to /tmp could otherwise run code here
+    try:
+        if time.time() - COMPANIES_SNAPSHOT.stat().st_mtime < max_age:
+            with open(COMPANIES_SNAPSHOT, encoding='utf-8') as f:
+                return [(str(name), str(nse), str(bse)) for name, nse, bse in json.load(f)]
+    except Exception:
+        pass
+    return None
+
+def read_companies():
+    """Read the companies CSV into the search indexes (see index_companies)"""
+    # A fresh snapshot left by another worker skips the download and parsing
+    records = read_companies_snapshot(COMPANIES_TTL)
+    if records is not None:
+        return index_companies(records)
+
+    try:
+        resp = urllib.request.urlopen(CSV_URL, timeout=30)
+    except OSError:
+        # GitHub unreachable on a cold start: an older snapshot beats no search at all
+        records = read_companies_snapshot(COMPANIES_SNAPSHOT_MAX_AGE)
+        if records is None:
+            raise
+        logging.warning("Companies CSV fetch failed; serving the on-disk snapshot")
+        return index_companies(records)
+
+    with resp:
+        reader = csv.DictReader(io.TextIOWrapper(resp, encoding='utf-8-sig'))
+        records = []
+        for row in reader:
+            name = (row.get('Name') or '').strip()
+            nse = (row.get('NSE Code') or '').strip()
+            bse = (row.get('BSE Code') or '').strip().removesuffix('.0')
+            if not bse.isdigit():
+                bse = ''
+            # Without either code there is no symbol to fetch, so the row can't be used
+            if not nse and not bse:
+                continue
+            records.append((name, nse, bse))
+
+    try:
+        tmp_path = COMPANIES_SNAPSHOT.with_name(f"{COMPANIES_SNAPSHOT.name}.{os.getpid()}")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(records, f, separators=(',', ':'))
+        os.replace(tmp_path, COMPANIES_SNAPSHOT)
+    except OSError as e:
+        logging.error(f"Could not write companies snapshot: {str(e)}")
+    return index_companies(records)
+
+def refresh_companies():
+    """Reload the company indexes off the request path and swap them in"""
+    try:
+        data = read_companies()
+    except Exception:
+        # Keep serving the previous copy; the next /search tries again
+        logging.exception("Companies CSV refresh failed")
+        data = None
+    with _company_lock:
+        if data is not None:
+            _company_cache['data'] = data
+            _company_cache['ts'] = time.time()
+        _company_cache['refreshing'] = False
+
+def load_companies():
+    """Return the cached company indexes; once older than COMPANIES_TTL they are still
+    served while a background thread reloads them"""
+    with _company_lock:
+        data = _company_cache['data']
+        if data is not None:
+            if time.time() - _company_cache['ts'] > COMPANIES_TTL and not _company_cache['refreshing']:
+                _company_cache['refreshing'] = True
+                threading.Thread(target=refresh_companies, daemon=True).start()
+            return data
+
+        # Nothing loaded yet (cold start, or the preload failed): load now, and let
+        # concurrent searches wait on the lock for this one load instead of repeating it
+        _company_cache['data'] = read_companies()
+        _company_cache['ts'] = time.time()
+        return _company_cache['data']
+
+def preload_companies():
+    """Load the company indexes at startup so the first /search doesn't wait on the CSV"""
+    try:
+        load_companies()
+    except Exception:
+        logging.exception("Companies CSV preload failed")
+
+threading.Thread(target=preload_companies, daemon=True).start()
 
 @app.route('/search', methods=['POST'])
 def search():
     try:
-        df = pd.read_csv(CSV_URL)
-        df['NSE Code'] = df['NSE Code'].astype(str).str.replace('nan', '')
-        df['BSE Code'] = df['BSE Code'].apply(lambda x: str(int(x)) if pd.notnull(x) and str(x).replace('.0','').isdigit() else '')
+        companies = load_companies()
     except:
         return jsonify({'error': 'Database error'})
 
     query = request.json.get('query', '').strip().lower()
+    names_lower = companies['names_lower']
+    names_sorted = companies['names_sorted']
     
-    match = df[
-        (df['Name'].str.lower().str.contains(query, na=False)) | 
-        (df['NSE Code'].str.lower() == query) | 
-        (df['BSE Code'] == query)
-    ]
+    rows = []
+    seen = set()
+
+    def add_rows(candidates):
+        for row in candidates:
+            if len(rows) >= SEARCH_LIMIT:
+                break
+            if row not in seen:
+                rows.append(row)
+                seen.add(row)
+
+    def prefix_rows():
+        i = bisect.bisect_left(names_sorted, (query,))
+        while i < len(names_sorted) and names_sorted[i][0].startswith(query):
+            yield names_sorted[i][1]
+            i += 1
 
-    if match.empty:
+    # Exact NSE/BSE code hits are dict lookups; then names starting with the query
+    # (bisect over the sorted index); only if that leaves room, names containing it
+    add_rows(companies['by_nse'].get(query, ()))
+    add_rows(companies['by_bse'].get(query, ()))
+    add_rows(prefix_rows())
+    add_rows(i for i, name in enumerate(names_lower) if query in name)
+
+    if not rows:
         return jsonify({'error': 'No company found'})
 
     matches = []
-    for _, row in match.head(10).iterrows():
-        symbol = row['NSE Code'] if row['NSE Code'] != '' else row['BSE Code']
-        matches.append({
-            'Name': row['Name'],
-            'NSE_Code': row['NSE Code'],
-            'BSE_Code': row['BSE Code'],
-            'symbol': symbol
-        })
-
+    for i in rows:
+        name, nse, bse = companies['records'][i]
+        matches.append({'Name': name, 'NSE_Code': nse, 'BSE_Code': bse, 'symbol': nse or bse})
     return jsonify({'matches': matches})
 
 @app.route('/extract')
@@ -708,32 +1058,62 @@ def extract():
     start_year = int(request.args.get('start_year', 2020))
     end_year = int(request.args.get('end_year', 2025))
     download_type = request.args.get('download_type', 'all')
-    session_id = f"{symbol}_{int(time.time())}"
+    # Random, not symbol+second: two users extracting the same company at once must not
+    # overwrite each other's download entry (and ids shouldn't be guessable). Hex only, so
+    # it goes into the /download URL as is even for symbols like M&M.
+    session_id = secrets.token_hex(8)
 
     def generate():
         fetcher = ScreenerUnifiedFetcher()
         
         def run_extraction():
-            company_root = fetcher.process_company(symbol, name, start_year, end_year, download_type)
-            if company_root:
-                download_sessions[session_id] = {
-                    'path': company_root,
-                    'timestamp': time.time()
-                }
+            try:
+                company_root = fetcher.process_company(symbol, name, start_year, end_year, download_type)
+                if company_root:
+                    with sessions_lock:
+                        download_sessions[session_id] = {
+                            'path': company_root,
+                            'files': fetcher.archive_files,
+                            'timestamp': time.time()
+                        }
+                        download_sessions.move_to_end(session_id)
+            except Exception as e:
+                # Without a terminal event the browser's EventSource would reconnect and rerun the extraction
+                logging.exception("Extraction failed")
+                fetcher.log_queue.put(f"ERROR|Extraction failed: {str(e)}")
+            finally:
+                fetcher.log_queue.put(None)  # end-of-stream sentinel
         
         thread = threading.Thread(target=run_extraction)
         thread.start()
 
-        while thread.is_alive() or not log_queue.empty():
-            try:
-                log_line = log_queue.get(timeout=0.1)
+        # Block until the next event, then take whatever else is already queued so a
+        # burst goes out as one write; PROGRESS is already rate-limited by the fetcher
+        done = False
+        while not done:
+            batch = [fetcher.log_queue.get()]
+            while True:
+                try:
+                    batch.append(fetcher.log_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            frames = []
+            for log_line in batch:
+                if log_line is None:
+                    done = True
+                    break
+                if log_line is PROGRESS_PENDING:
+                    log_line = fetcher.take_progress()
+                    if log_line is None:
+                        continue
                 if log_line.startswith('COMPLETE'):
                     parts = log_line.split('|')
-                    yield f"data: COMPLETE|{parts[1]}|{parts[2]}|{session_id}\n\n"
+                    frames.append(f"data: COMPLETE|{parts[1]}|{parts[2]}|{session_id}\n\n")
                 else:
-                    yield f"data: {log_line}\n\n"
-            except queue.Empty:
-                continue
+                    frames.append(f"data: {log_line}\n\n")
+            if frames:
+                yield "".join(frames)
 
     return Response(generate(), mimetype='text/event-stream')
 
@@ -741,48 +1121,29 @@ def extract():
 def download():
     session_id = request.args.get('session')
     
-    if not session_id or session_id not in download_sessions:
+    with sessions_lock:
+        session_data = download_sessions.get(session_id)
+    
+    if not session_data:
         return "No files available", 404
     
-    session_data = download_sessions[session_id]
     download_path = session_data['path']
     
     if not download_path or not Path(download_path).exists():
         return "Files not found", 404
     
-    memory_file = io.BytesIO()
-    
     try:
-        with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            root_path = Path(download_path)
-            file_count = 0
-            for file_path in root_path.rglob('*.pdf'):
-                arcname = file_path.relative_to(root_path.parent)
-                zipf.write(file_path, arcname)
-                file_count += 1
-            
-            if file_count == 0:
-                return "No PDF files found", 404
+        pdf_paths = session_data['files']
+        if not pdf_paths:
+            return "No PDF files found", 404
         
-        memory_file.seek(0)
         company_name = Path(download_path).name
         zip_filename = f"{company_name}_Documents.zip"
         
-        # Clean up old sessions (older than 5 minutes)
-        current_time = time.time()
-        sessions_to_delete = [
-            sid for sid, data in download_sessions.items() 
-            if current_time - data['timestamp'] > 300
-        ]
-        for sid in sessions_to_delete:
-            del download_sessions[sid]
-        
-        return send_file(
-            memory_file, 
-            mimetype='application/zip', 
-            as_attachment=True, 
-            download_name=zip_filename
-        )
+        # Bytes reach the client as each entry is written; nothing is buffered whole
+        response = Response(stream_zip(pdf_paths, os.path.dirname(download_path)), mimetype='application/zip')
+        response.headers.set('Content-Disposition', 'attachment', **attachment_filename(zip_filename))
+        return response
     except Exception as e:
         logging.error(f"Download error: {str(e)}")
         return f"Error creating ZIP: {str(e)}", 500